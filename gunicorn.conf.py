@@ -5,6 +5,7 @@ only needs to contain `from boostutils.configuration.gunicorndefaults import *`.
 http://docs.gunicorn.org/en/stable/settings.html
 """
 
+import os
 import sys
 import threading
 import traceback
@@ -19,6 +20,12 @@ accesslog = "-"
 bind = "0.0.0.0:8000"
 
 
+# Load the application in the master before forking workers.
+# Workers then start without importing Django and the app themselves, and share those pages.
+# Left off in dev, where --reload needs workers to import the latest code.
+preload_app = os.getenv("ENVIRONMENT") != "dev"
+
+
 def worker_abort(worker):
     """
     Called when a worker received the SIGABRT signal. This call generally happens on timeout.
@@ -1,16 +1,91 @@
 import json
+import re
+from collections import Counter
+from functools import lru_cache
 
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin, TabularInline
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import F, Func, IntegerField, QuerySet
+from django.http import Http404, HttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
-from pygments import highlight
-from pygments.formatters import HtmlFormatter
-from pygments.lexers import JsonLexer
 
-from zh.models import JobRun, Match, MatchPlayer, Player
+from zh.cache import cached_query, queryset_key, with_cached_count
+from zh.db_routers import read_from_replica
+from zh.models import JobRun, Match, MatchPlayer, MatchUpload, MatchupPair, Player
+
+ERRORS_PER_PAGE = 100
+ERROR_TIMESTAMP_PREFIX = re.compile(r"^\[[^\]]*\] ")
+ERRORS_SCRIPT = """
+<script>
+(function () {
+  const container = document.getElementById("job-run-errors");
+  container.addEventListener("click", function (event) {
+    const link = event.target.closest("[data-errors-url]");
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    fetch(link.dataset.errorsUrl, {credentials: "same-origin"})
+      .then((response) => response.text())
+      .then((html) => { container.innerHTML = html; });
+  });
+})();
+</script>
+"""
+
+
+@lru_cache(maxsize=1)
+def _json_highlighter():
+    # Pygments is only needed when errors are displayed, not at worker startup
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import JsonLexer
+
+    formatter = HtmlFormatter(style="github-dark")
+    return JsonLexer(), formatter, formatter.get_style_defs()
+
+
+def _highlight_json(data):
+    from pygments import highlight
+
+    lexer, formatter, style_defs = _json_highlighter()
+    return f"<style>{style_defs}</style>{highlight(data, lexer, formatter)}"
+
+
+def _error_count():
+    return Func(F("errors"), function="CARDINALITY", output_field=IntegerField())
+
+
+def _count_errors(job_run_id):
+    """Returns `(error, occurrences)` pairs for a job run, most frequent first."""
+    errors = JobRun.objects.filter(pk=job_run_id).values_list("errors", flat=True).get()
+    return Counter(ERROR_TIMESTAMP_PREFIX.sub("", error) for error in errors).most_common()
+
+
+def _errors_link(url, page_number, label):
+    link = f"{url}?page={page_number}"
+    return format_html('<a href="{}" data-errors-url="{}">{}</a>', link, link, label)
 
 
 class ReadOnlyMixin:
+    """Read-only admins, whose pages are served from the read replica when one is configured."""
+
+    def changelist_view(self, *args, **kwargs):
+        return self._render_from_replica(super().changelist_view, *args, **kwargs)
+
+    def change_view(self, *args, **kwargs):
+        return self._render_from_replica(super().change_view, *args, **kwargs)
+
+    def _render_from_replica(self, view, *args, **kwargs):
+        with read_from_replica():
+            response = view(*args, **kwargs)
+            # Template responses run most of their queries while rendering
+            if hasattr(response, "render"):
+                response.render()
+        return response
 
     def has_add_permission(self, *_args, **_kwargs):
         return False
@@ -30,6 +105,12 @@ def custom_titled_filter(title):
         def __new__(cls, *args, **kwargs):
             instance = admin.FieldListFilter.create(*args, **kwargs)
             instance.title = title
+            # Distinct values over large tables are expensive and only change with new data
+            if isinstance(getattr(instance, "lookup_choices", None), QuerySet):
+                choices = instance.lookup_choices
+                instance.lookup_choices = cached_query(
+                    queryset_key("filter_choices", choices), lambda: list(choices)
+                )
             return instance
 
     return Wrapper
@@ -37,6 +118,11 @@ def custom_titled_filter(title):
 
 class BaseModelAdmin(ModelAdmin):
     readonly_fields = ("id", "created_at", "modified_at")
+    cache_counts = True
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return with_cached_count(queryset) if self.cache_counts else queryset
 
 
 @admin.register(JobRun)
@@ -46,6 +132,7 @@ class JobRunAdmin(ReadOnlyMixin, BaseModelAdmin):
     search_fields = ("id",)
     date_hierarchy = "start_time"
     readonly_fields = ("loaded_match_count", "loaded_player_count")
+    cache_counts = False  # Runs are created and updated while a load is in progress
     fieldsets = (
         (
             None,
@@ -70,14 +157,77 @@ class JobRunAdmin(ReadOnlyMixin, BaseModelAdmin):
         ),
     )
 
+    def get_queryset(self, request):
+        # Errors can run into tens of thousands of entries, they are loaded page by page instead
+        return super().get_queryset(request).defer("errors").annotate(error_count=_error_count())
+
+    def get_urls(self):
+        return [
+            path(
+                "<uuid:object_id>/errors/",
+                self.admin_site.admin_view(self.errors_view),
+                name="zh_jobrun_errors",
+            ),
+            *super().get_urls(),
+        ]
+
     def pretty_logs(self, obj):
-        formatter = HtmlFormatter(style="github-dark")
-        prettified_data = highlight(
-            json.dumps(obj.errors, indent=2, sort_keys=True),
-            JsonLexer(),
-            formatter,
+        if not obj.error_count:
+            return "No errors"
+        url = reverse("admin:zh_jobrun_errors", args=(obj.pk,))
+        return format_html(
+            '<div id="job-run-errors">{} errors. '
+            '<a href="{}" data-errors-url="{}">Show errors</a></div>{}',
+            obj.error_count,
+            url,
+            url,
+            mark_safe(ERRORS_SCRIPT),
+        )
+
+    def errors_view(self, request, object_id):
+        """
+        Renders one page of a job run's errors, deduplicated (ignoring their timestamps) and
+        ordered by how often they occurred.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        with read_from_replica():
+            error_count = (
+                JobRun.objects.filter(pk=object_id)
+                .annotate(error_count=_error_count())
+                .values_list("error_count", flat=True)
+                .first()
+            )
+        if error_count is None:
+            raise Http404
+
+        # Cached per error count rather than only per data version, as a running load keeps
+        # adding errors
+        occurrences = cached_query(
+            f"job-run-errors:{object_id}:{error_count}", lambda: _count_errors(object_id)
+        )
+        page = Paginator(occurrences, ERRORS_PER_PAGE).get_page(request.GET.get("page"))
+        url = reverse("admin:zh_jobrun_errors", args=(object_id,))
+        links = []
+        if page.has_previous():
+            links.append(_errors_link(url, page.previous_page_number(), "Previous"))
+        if page.has_next():
+            links.append(_errors_link(url, page.next_page_number(), "Next"))
+        data = json.dumps(
+            [{"error": error, "occurrences": count} for error, count in page.object_list],
+            indent=2,
+        )
+        return HttpResponse(
+            format_html(
+                "<p>{} distinct of {} errors, page {} of {} {}</p>",
+                len(occurrences),
+                error_count,
+                page.number,
+                page.paginator.num_pages,
+                mark_safe(" ".join(links)),
+            )
+            + _highlight_json(data)
         )
-        return mark_safe(f"<style>{formatter.get_style_defs()}</style>{prettified_data}")
 
     pretty_logs.short_description = ""
 
@@ -94,6 +244,13 @@ class MatchPlayerInline(ReadOnlyMixin, TabularInline):
     extra = 0
 
 
+class MatchUploadInline(ReadOnlyMixin, TabularInline):
+    model = MatchUpload
+    fields = ("uploaded_by", "replay_url", "replay_upload_timestamp")
+    extra = 0
+    verbose_name = "alternate upload"
+
+
 @admin.register(Match)
 class MatchAdmin(ReadOnlyMixin, BaseModelAdmin):
     list_display = (
@@ -107,11 +264,11 @@ class MatchAdmin(ReadOnlyMixin, BaseModelAdmin):
         "match_length",
     )
     list_filter = (
-        "game_version",
-        "match_type",
+        ("game_version", custom_titled_filter("game version")),
+        ("match_type", custom_titled_filter("match type")),
         ("players__player__player_name", custom_titled_filter("participating player")),
         ("replay_uploaded_by__player_name", custom_titled_filter("uploaded by")),
-        "players__army",
+        ("players__army", custom_titled_filter("army")),
     )
     search_fields = (
         "id",
@@ -122,4 +279,17 @@ class MatchAdmin(ReadOnlyMixin, BaseModelAdmin):
         "players__army",
     )
     date_hierarchy = "replay_upload_timestamp"
-    inlines = (MatchPlayerInline,)
+    inlines = (MatchPlayerInline, MatchUploadInline)
+
+
+@admin.register(MatchupPair)
+class MatchupPairAdmin(ReadOnlyMixin, BaseModelAdmin):
+    # Match.__str__ loads the match's players, the id avoids that query per row
+    list_display = ("id", "match_timestamp", "player_a", "player_b", "same_team", "match_id")
+    list_select_related = ("player_a", "player_b")
+    # Newest pairs first by their time-ordered primary key, the history index only serves
+    # lookups of a given pair of players
+    ordering = ("-id",)
+    list_filter = ("same_team",)
+    search_fields = ("player_a__player_name", "player_b__player_name")
+    raw_id_fields = ("player_a", "player_b", "match")
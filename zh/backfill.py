@@ -0,0 +1,406 @@
+"""
+High-volume loading for `load_data --backfill`. Parsed replays are streamed with COPY into
+unlogged staging tables, then merged into the zh tables with a handful of set-based statements
+instead of one ORM round trip per row.
+"""
+
+import datetime
+import io
+import threading
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_duration
+
+from zh.gentool import match_fingerprint, split_player_data, unpack_replay_summary
+from zh.models import Match, MatchPlayer, MatchUpload, MatchupPair, Player
+from zh.utils import log, uuid7
+
+STAGING_TABLES = {
+    "zh_backfill_player": (
+        "id uuid NOT NULL, player_name text NOT NULL, gentool_id text",
+        ("id", "player_name", "gentool_id"),
+    ),
+    "zh_backfill_match": (
+        "id uuid NOT NULL, replay_url text NOT NULL, uploader_name text NOT NULL, "
+        "uploader_gentool_id text, replay_upload_timestamp timestamptz, map text NOT NULL, "
+        "game_version text NOT NULL, starting_cash integer NOT NULL, "
+        "match_length interval NOT NULL, match_type text NOT NULL, "
+        "match_timestamp timestamptz NOT NULL, replay_size integer NOT NULL, "
+        "fingerprint text NOT NULL",
+        (
+            "id",
+            "replay_url",
+            "uploader_name",
+            "uploader_gentool_id",
+            "replay_upload_timestamp",
+            "map",
+            "game_version",
+            "starting_cash",
+            "match_length",
+            "match_type",
+            "match_timestamp",
+            "replay_size",
+            "fingerprint",
+        ),
+    ),
+    "zh_backfill_match_player": (
+        "id uuid NOT NULL, match_id uuid NOT NULL, player_name text NOT NULL, team integer, "
+        "army text NOT NULL",
+        ("id", "match_id", "player_name", "team", "army"),
+    ),
+}
+# Staged uploader folders, one per gentool id: like load_data, which resolves uploaders by gentool
+# id before name, the first folder staged for an id gives its player's name and later folder
+# names (renames) resolve to that player
+STAGED_UPLOADERS = """
+    SELECT DISTINCT ON (gentool_id) id, player_name, gentool_id
+    FROM zh_backfill_player
+    WHERE gentool_id IS NOT NULL
+    ORDER BY gentool_id, id
+"""
+# Tables whose non-unique indexes `defer_indexes` drops during the merge and rebuilds after it
+DEFERRABLE_INDEX_MODELS = (Match, MatchPlayer, MatchupPair)
+# Time-ordered UUID (see zh.utils.uuid7) for rows created in SQL; Postgres 16 has no uuidv7()
+UUID7_SQL = (
+    "encode(set_bit(set_bit(overlay(uuid_send(gen_random_uuid()) placing "
+    "substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3) "
+    "FROM 1 FOR 6), 52, 1), 53, 1), 'hex')::uuid"
+)
+
+
+def _too_long(model, values):
+    """Names of the `values` longer than the max_length of `model`'s field, if it has one."""
+    too_long = set()
+    for field, value in values.items():
+        max_length = model._meta.get_field(field).max_length
+        if max_length is not None and len(str(value)) > max_length:
+            too_long.add(field)
+    return too_long
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime.timedelta):
+        return f"{value.total_seconds()} seconds"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class BackfillLoader:
+    """
+    Buffers parsed replays and COPYs them into the staging tables every `batch_size` matches.
+    `add` may be called from several threads, each COPY uses the calling thread's connection.
+    """
+
+    def __init__(self, job_run, batch_size=5000, defer_indexes=False):
+        self.job_run = job_run
+        self.batch_size = batch_size
+        self.defer_indexes = defer_indexes
+        self._lock = threading.Lock()
+        self._rows = {table: [] for table in STAGING_TABLES}
+        self._staged_players = set()
+
+    def create_staging_tables(self):
+        with connection.cursor() as cursor:
+            for table, (columns, _) in STAGING_TABLES.items():
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                cursor.execute(f"CREATE UNLOGGED TABLE {table} ({columns})")
+
+    def drop_staging_tables(self):
+        with connection.cursor() as cursor:
+            for table in STAGING_TABLES:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    def add(self, replay_url, player_data, replay_upload_timestamp, replay_summary):
+        uploader_name, uploader_gentool_id = split_player_data(player_data)
+
+        match_data = unpack_replay_summary(replay_summary)
+        players = match_data.pop("players")
+        # Parsed like the ORM's DurationField, Postgres would read "MM:SS" as hours and minutes
+        if match_data["match_length"] is not None:
+            match_data["match_length"] = parse_duration(match_data["match_length"])
+        missing = [field for field, value in match_data.items() if value is None]
+        if missing:
+            raise ValueError(f"Cannot load {replay_url}, missing {', '.join(missing)}")
+        # Staging columns are unbounded text, so values the zh columns cannot hold are rejected
+        # here rather than failing the merge of the whole batch
+        too_long = _too_long(Match, {**match_data, "replay_url": replay_url})
+        too_long |= _too_long(
+            Player, {"player_name": uploader_name, "gentool_id": uploader_gentool_id}
+        )
+        for player in players:
+            too_long |= _too_long(Player, {"player_name": player["player_name"]})
+            too_long |= _too_long(MatchPlayer, {"army": player["army"]})
+        if too_long:
+            raise ValueError(f"Cannot load {replay_url}, too long {', '.join(sorted(too_long))}")
+
+        match_id = uuid7()
+        match_row = (
+            match_id,
+            replay_url,
+            uploader_name,
+            uploader_gentool_id,
+            replay_upload_timestamp,
+            match_data["map"],
+            match_data["game_version"],
+            match_data["starting_cash"],
+            match_data["match_length"],
+            match_data["match_type"],
+            match_data["match_timestamp"],
+            match_data["replay_size"],
+            match_fingerprint(
+                match_data["match_timestamp"],
+                match_data["map"],
+                match_data["match_length"],
+                [player["player_name"] for player in players],
+            ),
+        )
+        match_player_rows = [
+            (uuid7(), match_id, player["player_name"], player["team"], player["army"])
+            for player in players
+        ]
+
+        with self._lock:
+            # The participant named like the folder is the uploader (see "match players"), so
+            # they are not also staged as a player known only by name
+            player_keys = {(uploader_name, uploader_gentool_id)} | {
+                (player["player_name"], None)
+                for player in players
+                if player["player_name"] != uploader_name
+            }
+            for player_name, gentool_id in player_keys - self._staged_players:
+                self._rows["zh_backfill_player"].append((uuid7(), player_name, gentool_id))
+            self._staged_players |= player_keys
+            self._rows["zh_backfill_match"].append(match_row)
+            self._rows["zh_backfill_match_player"].extend(match_player_rows)
+
+            if len(self._rows["zh_backfill_match"]) < self.batch_size:
+                return
+            rows, self._rows = self._rows, {table: [] for table in STAGING_TABLES}
+
+        self._copy(rows)
+
+    def flush(self):
+        with self._lock:
+            rows, self._rows = self._rows, {table: [] for table in STAGING_TABLES}
+        self._copy(rows)
+
+    def _copy(self, rows):
+        with connection.cursor() as cursor:
+            for table, table_rows in rows.items():
+                if not table_rows:
+                    continue
+                buffer = io.StringIO()
+                for row in table_rows:
+                    buffer.write("\t".join(_copy_value(value) for value in row))
+                    buffer.write("\n")
+                buffer.seek(0)
+                _, columns = STAGING_TABLES[table]
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+        log(f"Staged {len(rows['zh_backfill_match'])} matches")
+
+    def merge(self):
+        """
+        Merges the staging tables into the zh tables in one transaction and returns the number of
+        rows written per table.
+        """
+        counts = {}
+        with transaction.atomic(), connection.cursor() as cursor:
+            deferred_indexes = self._drop_indexes(cursor) if self.defer_indexes else []
+
+            for name, sql in self._merge_statements():
+                cursor.execute(sql, {"job_run_id": self.job_run.id})
+                counts[name] = cursor.rowcount
+                log(f"Backfill merge: {name} ({cursor.rowcount} rows)")
+
+            if deferred_indexes:
+                # Django's foreign keys are deferred, and indexes cannot be built on tables with
+                # pending constraint checks
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+            for index_name, index_definition in deferred_indexes:
+                log(f"Rebuilding index {index_name}")
+                cursor.execute(index_definition)
+        return counts
+
+    def _drop_indexes(self, cursor):
+        cursor.execute(
+            """
+            SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid)
+            FROM pg_index
+            JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = ANY(%s::regclass[])
+              AND NOT pg_index.indisunique
+              AND NOT pg_index.indisprimary
+            """,
+            [[model._meta.db_table for model in DEFERRABLE_INDEX_MODELS]],
+        )
+        indexes = cursor.fetchall()
+        for index_name, _ in indexes:
+            log(f"Dropping index {index_name} until the merge is done")
+            cursor.execute(f'DROP INDEX "{index_name}"')
+        return indexes
+
+    def _merge_statements(self):
+        player = Player._meta.db_table
+        match = Match._meta.db_table
+        match_player = MatchPlayer._meta.db_table
+        match_upload = MatchUpload._meta.db_table
+        matchup_pair = MatchupPair._meta.db_table
+        uploader_id = "COALESCE(by_gentool_id.id, by_name.id)"
+        uploader_joins = """
+            LEFT JOIN backfill_gentool_ids by_gentool_id
+              ON by_gentool_id.gentool_id = staged.uploader_gentool_id
+            LEFT JOIN backfill_player_ids by_name ON by_name.player_name = staged.uploader_name
+        """
+        return (
+            (
+                "player gentool ids",
+                # Same as load_data: uploaders matched by name get their gentool id filled in
+                f"""
+                UPDATE {player} existing
+                SET gentool_id = staged.gentool_id, modified_at = now()
+                FROM (
+                    SELECT DISTINCT ON (player_name) player_name, gentool_id
+                    FROM ({STAGED_UPLOADERS}) uploaders
+                    ORDER BY player_name, gentool_id
+                ) staged
+                WHERE existing.player_name = staged.player_name
+                  AND existing.gentool_id IS NULL
+                  AND NOT EXISTS (
+                      SELECT 1 FROM {player} other WHERE other.gentool_id = staged.gentool_id
+                  )
+                """,
+            ),
+            (
+                "players",
+                # Uploaders are known by gentool id or name, other participants by name only
+                f"""
+                INSERT INTO {player}
+                    (id, created_at, modified_at, job_run_id, player_name, gentool_id)
+                SELECT DISTINCT ON (staged.player_name)
+                    staged.id, now(), now(), %(job_run_id)s, staged.player_name, staged.gentool_id
+                FROM (
+                    ({STAGED_UPLOADERS})
+                    UNION ALL
+                    SELECT id, player_name, gentool_id
+                    FROM zh_backfill_player
+                    WHERE gentool_id IS NULL
+                ) staged
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {player} existing
+                    WHERE existing.player_name = staged.player_name
+                       OR existing.gentool_id = staged.gentool_id
+                )
+                ORDER BY staged.player_name, staged.gentool_id NULLS LAST
+                """,
+            ),
+            (
+                "player ids by gentool id",
+                f"""
+                CREATE TEMPORARY TABLE backfill_gentool_ids ON COMMIT DROP AS
+                SELECT DISTINCT ON (gentool_id) gentool_id, id
+                FROM {player}
+                WHERE gentool_id IN (SELECT gentool_id FROM zh_backfill_player)
+                ORDER BY gentool_id, created_at
+                """,
+            ),
+            (
+                "player ids by name",
+                f"""
+                CREATE TEMPORARY TABLE backfill_player_ids ON COMMIT DROP AS
+                SELECT DISTINCT ON (player_name) player_name, id
+                FROM {player}
+                WHERE player_name IN (SELECT player_name FROM zh_backfill_player)
+                ORDER BY player_name, created_at
+                """,
+            ),
+            (
+                "matches",
+                # One match per fingerprint, skipping replays already stored in any form
+                f"""
+                INSERT INTO {match} (
+                    id, created_at, modified_at, job_run_id, map, replay_url, game_version,
+                    starting_cash, match_length, match_type, match_timestamp, replay_size,
+                    replay_uploaded_by_id, replay_upload_timestamp, fingerprint
+                )
+                SELECT DISTINCT ON (staged.fingerprint)
+                    staged.id, now(), now(), %(job_run_id)s, staged.map, staged.replay_url,
+                    staged.game_version, staged.starting_cash, staged.match_length,
+                    staged.match_type, staged.match_timestamp, staged.replay_size,
+                    {uploader_id}, staged.replay_upload_timestamp, staged.fingerprint
+                FROM zh_backfill_match staged
+                {uploader_joins}
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {match} existing WHERE existing.replay_url = staged.replay_url
+                )
+                  AND NOT EXISTS (
+                    SELECT 1 FROM {match_upload} existing
+                    WHERE existing.replay_url = staged.replay_url
+                )
+                ORDER BY staged.fingerprint, staged.replay_upload_timestamp, staged.replay_url
+                ON CONFLICT (fingerprint) DO NOTHING
+                """,
+            ),
+            (
+                "alternate uploads",
+                f"""
+                INSERT INTO {match_upload} (
+                    id, created_at, modified_at, match_id, uploaded_by_id, replay_url,
+                    replay_upload_timestamp
+                )
+                SELECT
+                    staged.id, now(), now(), canonical.id, {uploader_id}, staged.replay_url,
+                    staged.replay_upload_timestamp
+                FROM zh_backfill_match staged
+                JOIN {match} canonical ON canonical.fingerprint = staged.fingerprint
+                {uploader_joins}
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {match} existing WHERE existing.replay_url = staged.replay_url
+                )
+                ON CONFLICT (replay_url) DO NOTHING
+                """,
+            ),
+            (
+                "match players",
+                # Staged match ids only exist in the match table if the match was inserted above
+                f"""
+                INSERT INTO {match_player}
+                    (id, created_at, modified_at, match_id, player_id, team, army)
+                SELECT
+                    staged.id, now(), now(), staged.match_id,
+                    CASE
+                        WHEN staged.player_name = staged_match.uploader_name
+                        THEN inserted.replay_uploaded_by_id
+                        ELSE by_name.id
+                    END,
+                    staged.team, staged.army
+                FROM zh_backfill_match_player staged
+                JOIN {match} inserted ON inserted.id = staged.match_id
+                JOIN zh_backfill_match staged_match ON staged_match.id = staged.match_id
+                LEFT JOIN backfill_player_ids by_name ON by_name.player_name = staged.player_name
+                """,
+            ),
+            (
+                "matchup pairs",
+                f"""
+                INSERT INTO {matchup_pair} (
+                    id, created_at, modified_at, player_a_id, player_b_id, match_id, same_team,
+                    match_timestamp
+                )
+                SELECT
+                    {UUID7_SQL}, now(), now(), a.player_id, b.player_id, a.match_id,
+                    a.team IS NOT NULL AND a.team = b.team, inserted.match_timestamp
+                FROM {match} inserted
+                JOIN zh_backfill_match staged ON staged.id = inserted.id
+                JOIN {match_player} a ON a.match_id = inserted.id
+                JOIN {match_player} b ON b.match_id = inserted.id AND a.player_id < b.player_id
+                ON CONFLICT (player_a_id, player_b_id, match_id) DO NOTHING
+                """,
+            ),
+        )
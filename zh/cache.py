@@ -0,0 +1,95 @@
+import hashlib
+import os
+import threading
+import time
+
+from django.core.cache import caches
+from django.db.models import QuerySet
+
+from zh.db_routers import read_from_replica
+from zh.models import JobRun
+
+CACHE_ALIAS = "queries"
+VERSION_TTL = 10  # Seconds a looked up data version is reused before checking again
+
+_MISSING = object()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+_version = {"value": None, "checked_at": 0.0}
+
+
+def data_version():
+    """
+    Returns the id of the most recently completed successful JobRun. Data only changes when a
+    load finishes, so cache entries are versioned by it and go stale as soon as another run
+    completes. Runs are ordered by completion (their last save marks them successful) rather
+    than start, as overlapping loads can finish in any order.
+    """
+    now = time.monotonic()
+    if _version["value"] is None or now - _version["checked_at"] > VERSION_TTL:
+        # Read where the cached queries read, so a lagging replica is not cached as newer data
+        with read_from_replica():
+            job_run_id = (
+                JobRun.objects.filter(success=True)
+                .order_by("-modified_at")
+                .values_list("id", flat=True)
+                .first()
+            )
+        _version["value"] = str(job_run_id or "empty")
+        _version["checked_at"] = now
+    return _version["value"]
+
+
+def cached_query(key, compute, timeout=None):
+    """
+    Returns the cached value for `key` at the current data version, computing it (on the read
+    replica, if configured) when needed.
+    """
+    cache = caches[CACHE_ALIAS]
+    version = data_version()
+    value = cache.get(key, _MISSING, version=version)
+    hit = value is not _MISSING
+    with _lock:
+        _stats["hits" if hit else "misses"] += 1
+    if not hit:
+        with read_from_replica():
+            value = compute()
+        cache.set(key, value, timeout, version=version)
+    return value
+
+
+def queryset_key(prefix, queryset):
+    sql, params = queryset.query.sql_with_params()
+    return f"{prefix}:{hashlib.sha256(repr((sql, params)).encode()).hexdigest()}"
+
+
+def cache_stats():
+    """
+    Returns the hit and miss counts of this process. Each gunicorn worker counts its own lookups,
+    so the stats describe whichever worker served the request, identified by `process`.
+    """
+    with _lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    lookups = hits + misses
+    return {
+        "process": os.getpid(),
+        "version": _version["value"],
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / lookups if lookups else None,
+    }
+
+
+class CachedCountQuerySet(QuerySet):
+    """QuerySet whose `count()` results are cached per query until the data version changes."""
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        return cached_query(queryset_key("count", self), super().count)
+
+
+def with_cached_count(queryset):
+    return CachedCountQuerySet(
+        model=queryset.model, query=queryset.query.chain(), using=queryset._db
+    )
@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_ALIAS = "replica"
+
+_use_replica = ContextVar("use_replica", default=False)
+
+
+def replica_alias():
+    """Returns the replica's alias when one is configured, the primary's otherwise."""
+    return REPLICA_ALIAS if REPLICA_ALIAS in settings.DATABASES else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def read_from_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of `zh` models made inside `read_from_replica()` to the replica, everything else
+    to the primary. Reads are on the primary by default, so the loader (and its worker threads,
+    which do not inherit the context) always reads its own writes, and auth and session tables
+    are never read from a possibly lagging replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == "zh" and _use_replica.get():
+            return replica_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
@@ -0,0 +1,200 @@
+import csv
+import datetime
+import json
+from itertools import batched
+from uuid import UUID
+
+from zh.models import MatchPlayer
+
+# Output column -> MatchPlayer lookup. One exported row per match participant.
+EXPORT_COLUMNS = {
+    "match_id": "match_id",
+    "match_created_at": "match__created_at",
+    "match_timestamp": "match__match_timestamp",
+    "map": "match__map",
+    "game_version": "match__game_version",
+    "match_type": "match__match_type",
+    "starting_cash": "match__starting_cash",
+    "match_length": "match__match_length",
+    "replay_url": "match__replay_url",
+    "replay_size": "match__replay_size",
+    "replay_upload_timestamp": "match__replay_upload_timestamp",
+    "replay_uploaded_by": "match__replay_uploaded_by__player_name",
+    "match_player_id": "id",
+    "player_id": "player_id",
+    "player_name": "player__player_name",
+    "gentool_id": "player__gentool_id",
+    "team": "team",
+    "army": "army",
+}
+# Arrow has no UUID type in the schema below, these are exported as strings
+UUID_COLUMNS = ("match_id", "match_player_id", "player_id")
+EXPORT_FORMATS = ("ndjson", "csv", "parquet")
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class ExportError(Exception):
+    pass
+
+
+def iter_match_rows(
+    start=None,
+    end=None,
+    created_after=None,
+    job_run_ids=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    using=None,
+):
+    """
+    Yields one tuple per MatchPlayer (columns as in EXPORT_COLUMNS, values as returned by the
+    database), read through a server-side cursor so memory use does not depend on the size of the
+    export.
+
+    `start` and `end` bound the match timestamp, `created_after` only returns matches loaded after
+    a given time (see the `match_created_at` column) and `job_run_ids` only those loaded by the
+    given runs.
+    """
+    queryset = MatchPlayer.objects.all()
+    if using:
+        queryset = queryset.using(using)
+    if start:
+        queryset = queryset.filter(match__match_timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(match__match_timestamp__lt=end)
+    if created_after:
+        queryset = queryset.filter(match__created_at__gt=created_after)
+    if job_run_ids is not None:
+        queryset = queryset.filter(match__job_run_id__in=job_run_ids)
+
+    queryset = queryset.order_by("match__created_at", "match_id", "team").values_list(
+        *EXPORT_COLUMNS.values()
+    )
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def _to_primitive(value):
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    return value
+
+
+def render(rows, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Returns an iterator of output chunks (str for text formats, bytes for parquet) for `rows`.
+    Chunks are produced as the rows are consumed, so they can be written to a file or streamed in
+    an HTTP response as-is.
+    """
+    if export_format == "ndjson":
+        return _render_ndjson(rows)
+    if export_format == "csv":
+        return _render_csv(rows)
+    if export_format == "parquet":
+        return _render_parquet(rows, chunk_size)
+    raise ExportError(f"Unknown export format: {export_format}")
+
+
+def _render_ndjson(rows):
+    columns = tuple(EXPORT_COLUMNS)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_to_primitive, row)))) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _render_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow(map(_to_primitive, row))
+
+
+class _ChunkSink:
+    """
+    Write-only file object handing the buffers written since the last `drain` back out as they
+    are, without joining them.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+def _render_parquet(rows, chunk_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ExportError("Parquet exports require the parquet extra (pyarrow)") from e
+
+    schema = pa.schema(
+        [
+            ("match_id", pa.string()),
+            ("match_created_at", pa.timestamp("us", tz="UTC")),
+            ("match_timestamp", pa.timestamp("us", tz="UTC")),
+            ("map", pa.string()),
+            ("game_version", pa.string()),
+            ("match_type", pa.string()),
+            ("starting_cash", pa.int64()),
+            ("match_length", pa.duration("s")),
+            ("replay_url", pa.string()),
+            ("replay_size", pa.int64()),
+            ("replay_upload_timestamp", pa.timestamp("us", tz="UTC")),
+            ("replay_uploaded_by", pa.string()),
+            ("match_player_id", pa.string()),
+            ("player_id", pa.string()),
+            ("player_name", pa.string()),
+            ("gentool_id", pa.string()),
+            ("team", pa.int64()),
+            ("army", pa.string()),
+        ]
+    )
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batched(rows, chunk_size):
+            writer.write_batch(
+                pa.RecordBatch.from_arrays(
+                    [
+                        pa.array(
+                            map(str, column) if field.name in UUID_COLUMNS else column,
+                            type=field.type,
+                        )
+                        for column, field in zip(zip(*batch), schema)
+                    ],
+                    schema=schema,
+                )
+            )
+            yield from sink.drain()
+    yield from sink.drain()
@@ -0,0 +1,190 @@
+"""
+Parsing of GenTool listings and replay summaries. This module must not import Django models, so
+it can be loaded by the worker processes that parse in parallel. Functions meant to run in those
+workers return plain tuples, which are cheap to pickle back to the crawler.
+"""
+
+import datetime
+import hashlib
+import os
+import re
+
+from dateutil.parser import isoparse
+from django.utils.dateparse import parse_duration
+
+from zh.utils import log
+
+MATCH_FIELDS = (
+    "game_version",
+    "map",
+    "starting_cash",
+    "match_length",
+    "match_type",
+    "match_timestamp",
+    "replay_size",
+)
+
+
+def parse_links(data, extension=None, minimum_timestamp=None):
+    """
+    Returns the `(name, timestamp)` entries of a GenTool directory listing, oldest first.
+    """
+    # Imported here so only the processes parsing listings pay for it
+    from bs4 import BeautifulSoup
+
+    if minimum_timestamp is None:
+        minimum_timestamp = datetime.datetime(1900, 1, 1).astimezone(datetime.timezone.utc)
+
+    soup = BeautifulSoup(data, "html.parser")
+    results = {}
+    for link in soup.find_all("a"):
+        name = link["href"].strip("/")
+        if link.find_parent("th") or any(prefix in name for prefix in ("data", "logs")):
+            continue
+        if extension and not name.endswith(extension):
+            continue
+        row = link.find_parent("tr")
+        timestamp = isoparse(f"{row.find_all('td')[2].text.strip()}:00").astimezone(  # NOQA E231
+            datetime.timezone.utc
+        )
+        if timestamp is None or timestamp >= minimum_timestamp:
+            results[name] = timestamp
+
+    return tuple(sorted(results.items(), key=lambda item: item[1]))  # Sort by timestamp
+
+
+def parse_replay_data(data):
+    # Initialize the dictionary to store extracted fields
+    extracted_data = {}
+
+    # Define regex patterns for the required fields
+    patterns = {
+        "game_version": r"Game Version:\s+Zero Hour ([\d.]+)",
+        "map": r"Map Name:\s+(?:maps/)?(.+)",
+        "starting_cash": r"Start Cash:\s+(\d+)",
+        "match_length": r"Match Length:\s+([\d:]+)",
+        "match_type": r"Match Type:\s+(.+)",
+        "match_timestamp": r"Match Date \(UTC\):\s+(.+)",
+        "replay_size": r"\.rep \[(\d+) bytes\]",
+    }
+
+    # Extract individual fields using regex
+    for key, pattern in patterns.items():
+        match = re.search(pattern, data)
+        value = match.group(1) if match else None
+
+        if key == "match_timestamp" and value:
+            try:
+                value = datetime.datetime.strptime(value, "%Y %b %d, %H:%M:%S").astimezone(
+                    datetime.timezone.utc
+                )
+            except ValueError as e:
+                log(f"Error parsing date: {e}")
+                value = None
+        if key == "game_version" and not value:
+            value = "Unknown"
+
+        if key == "rep_file_size" and value:
+            value = int(value) / 1024  # Convert file size to an integer in KB
+
+        extracted_data[key] = value
+
+    # Regex patterns for teams and players
+    team_pattern = r"Team (\d+)\n((?:\s+\S+ -?\S+ \([^)]+\)\n?)+)"
+    player_pattern = r"^\s*\S+\s+(-?\S+)\s\(([^)]+)\)$"
+
+    # Extract teams and players
+    teams = {}
+    for team_match in re.finditer(team_pattern, data, re.MULTILINE):
+        team_number = int(team_match.group(1))
+        team_players = team_match.group(2)
+
+        players = re.findall(player_pattern, team_players, re.MULTILINE)
+        teams[team_number] = [{"player_name": name, "army": army} for name, army in players]
+
+    # Extract players without a team (if any)
+    no_team_section = data.split("Team ")[0]
+    no_team_players = re.findall(player_pattern, no_team_section, re.MULTILINE)
+
+    # Prepare the final list of players
+    extracted_data["players"] = []
+
+    # Add team players to the final list
+    for team_number, players in teams.items():
+        for player in players:
+            player["team"] = team_number
+            extracted_data["players"].append(player)
+
+    # Add no-team players (with team set to None)
+    for name, army in no_team_players:
+        extracted_data["players"].append({"player_name": name, "army": army, "team": None})
+
+    return extracted_data
+
+
+def split_player_data(player_data):
+    """
+    Splits an uploader's folder name, `<player name>_<gentool id>`, into its name and gentool
+    id. The name is the one the uploader played under, which may differ from the name stored
+    for their gentool id once they rename.
+    """
+    parts = player_data.split("_")
+    return "_".join(parts[:-1]), parts[-1]
+
+
+def match_fingerprint(match_timestamp, map_name, match_length, player_names):
+    """
+    Identifies a game independently of who uploaded it: every participant uploads their own copy
+    of the same game, each with the same start time, map, length and participants.
+    `match_length` may be the parsed string or the stored timedelta.
+    """
+    if match_timestamp is None:
+        return None
+    if isinstance(match_length, str):
+        match_length = parse_duration(match_length)
+    timestamp = match_timestamp.astimezone(datetime.timezone.utc).isoformat()
+    seconds = str(int(match_length.total_seconds())) if match_length is not None else ""
+    key = "\x1f".join((timestamp, map_name or "", seconds, *sorted(player_names)))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def pack_replay_data(match_data):
+    """
+    Packs the output of `parse_replay_data` into a `(fields, players)` tuple, with fields ordered
+    as MATCH_FIELDS and players as `(player_name, army, team)` tuples.
+    """
+    return (
+        tuple(match_data[field] for field in MATCH_FIELDS),
+        tuple((p["player_name"], p["army"], p["team"]) for p in match_data["players"]),
+    )
+
+
+def unpack_replay_summary(replay_summary):
+    fields, players = replay_summary
+    return {
+        **dict(zip(MATCH_FIELDS, fields)),
+        "players": [
+            {"player_name": player_name, "army": army, "team": team}
+            for player_name, army, team in players
+        ],
+    }
+
+
+def parse_replay_summary(data):
+    return pack_replay_data(parse_replay_data(data))
+
+
+def parse_replay_file(path):
+    """
+    Parses a GenTool `.txt` replay summary from disk. If the summary does not mention the replay
+    size, the size of the `.rep` file next to it is used instead.
+    """
+    with open(path, encoding="utf-8", errors="replace") as f:
+        data = f.read()
+
+    match_data = parse_replay_data(data)
+    if match_data["replay_size"] is None:
+        rep_path = os.path.splitext(path)[0] + ".rep"
+        if os.path.exists(rep_path):
+            match_data["replay_size"] = os.path.getsize(rep_path)
+    return pack_replay_data(match_data)
@@ -0,0 +1,102 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from zh.gentool import match_fingerprint
+from zh.models import JobRun, Match, MatchUpload
+from zh.utils import log
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprints every stored match and merges copies of the same game uploaded by "
+        "different participants into alternate uploads. Run it while load_data is not running."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        job_run = JobRun.objects.create(start_time=timezone.now(), duration=None, success=False)
+        # Copies of a game share its start time, so they are adjacent in this order and the
+        # earliest upload of each game is seen first and kept
+        matches = (
+            Match.objects.order_by(
+                "match_timestamp", "replay_upload_timestamp", "created_at", "id"
+            )
+            .only(
+                "id",
+                "fingerprint",
+                "map",
+                "match_length",
+                "match_timestamp",
+                "replay_url",
+                "replay_uploaded_by_id",
+                "replay_upload_timestamp",
+            )
+            .prefetch_related("players__player")
+        )
+
+        self.match_count = 0
+        self.merged_count = 0
+        canonical_matches = {}
+        match_timestamp = None
+        fingerprinted = []
+        duplicates = {}
+        for match in matches.iterator(chunk_size=batch_size):
+            if match.match_timestamp != match_timestamp:
+                # Flushing only between start times keeps every game's copies in one batch
+                if len(fingerprinted) + len(duplicates) >= batch_size:
+                    self._flush(fingerprinted, duplicates)
+                    fingerprinted = []
+                    duplicates = {}
+                canonical_matches = {}
+                match_timestamp = match.match_timestamp
+
+            self.match_count += 1
+            fingerprint = match_fingerprint(
+                match.match_timestamp,
+                match.map,
+                match.match_length,
+                [match_player.player.player_name for match_player in match.players.all()],
+            )
+            if fingerprint in canonical_matches:
+                duplicates[match] = canonical_matches[fingerprint]
+                continue
+
+            canonical_matches[fingerprint] = match
+            if match.fingerprint != fingerprint:
+                match.fingerprint = fingerprint
+                fingerprinted.append(match)
+
+        self._flush(fingerprinted, duplicates)
+
+        # Completing the run advances the data version, so cached stats that still count the
+        # merged copies are no longer served
+        job_run.duration = timezone.now() - job_run.start_time
+        job_run.success = True
+        job_run.save(update_fields=["duration", "success", "modified_at"])
+
+    @transaction.atomic
+    def _flush(self, fingerprinted, duplicates):
+        for duplicate, canonical_match in duplicates.items():
+            MatchUpload.objects.filter(match=duplicate).update(match=canonical_match)
+        MatchUpload.objects.bulk_create(
+            MatchUpload(
+                match=canonical_match,
+                uploaded_by_id=duplicate.replay_uploaded_by_id,
+                replay_url=duplicate.replay_url,
+                replay_upload_timestamp=duplicate.replay_upload_timestamp,
+            )
+            for duplicate, canonical_match in duplicates.items()
+        )
+        # Removes the copies' players and matchup pairs too, so they stop counting in stats
+        Match.objects.filter(id__in=[duplicate.id for duplicate in duplicates]).delete()
+        Match.objects.bulk_update(fingerprinted, ["fingerprint"], batch_size=1000)
+
+        self.merged_count += len(duplicates)
+        log(
+            f"Fingerprinted {self.match_count} matches and merged {self.merged_count} duplicate "
+            "uploads"
+        )
@@ -0,0 +1,43 @@
+from django.core.management import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from zh.models import JobRun, Match, MatchupPair
+from zh.utils import log
+
+
+class Command(BaseCommand):
+    help = "Builds head-to-head matchup pairs for matches loaded before pairs were maintained"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        job_run = JobRun.objects.create(start_time=timezone.now(), duration=None, success=False)
+        matches = (
+            Match.objects.filter(~Exists(MatchupPair.objects.filter(match=OuterRef("pk"))))
+            .order_by()
+            .only("id", "match_timestamp")
+            .prefetch_related("players")
+        )
+
+        pairs = []
+        match_count = 0
+        pair_count = 0
+        for match in matches.iterator(chunk_size=batch_size):
+            pairs.extend(MatchupPair.build_for_match(match, match.players.all()))
+            match_count += 1
+            if len(pairs) >= batch_size:
+                pair_count += len(MatchupPair.objects.bulk_create(pairs, ignore_conflicts=True))
+                pairs = []
+                log(f"Backfilled {pair_count} matchup pairs from {match_count} matches")
+
+        pair_count += len(MatchupPair.objects.bulk_create(pairs, ignore_conflicts=True))
+        log(f"Backfilled {pair_count} matchup pairs from {match_count} matches")
+
+        # Completing the run advances the data version, so cached head-to-head results computed
+        # without these pairs are no longer served
+        job_run.duration = timezone.now() - job_run.start_time
+        job_run.success = True
+        job_run.save(update_fields=["duration", "success", "modified_at"])
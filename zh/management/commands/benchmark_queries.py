@@ -0,0 +1,198 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from zh.cache import CACHE_ALIAS
+from zh.db_routers import replica_alias
+from zh.models import Match, MatchPlayer, MatchupPair, Player
+from zh.utils import log
+
+BENCHMARK_USERNAME = "benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the main admin pages, API endpoints and stats queries against the current "
+        "database, checks their query counts and records the EXPLAIN plan of their slowest query"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--output", help="Write results and plans as JSON to this file")
+        parser.add_argument(
+            "--baseline",
+            help="Results of a previous run; fail if a case got slower than --tolerance allows",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=1.5,
+            help="Allowed slowdown factor against --baseline",
+        )
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Capture EXPLAIN ANALYZE plans, which runs the slowest queries once more",
+        )
+
+    def handle(self, *args, **options):
+        self.repeat = options["repeat"]
+        self.analyze = options["analyze"]
+        self.client = Client()
+        self.client.force_login(self._get_user())
+
+        top_players = list(
+            Player.objects.annotate(match_count=Count("matches"))
+            .order_by("-match_count")
+            .values_list("id", "player_name")[:2]
+        )
+        if len(top_players) < 2:
+            raise CommandError("Needs at least two players, see generate_synthetic_data")
+        (player_id, player_name), (other_player_id, _) = top_players
+
+        results = {}
+        for name, url, max_queries in self._pages(player_id, player_name, other_player_id):
+            results[name] = self._measure(lambda url=url: self._get(url), max_queries)
+        for name, queryset, max_queries in self._stats_queries(player_id, other_player_id):
+            results[name] = self._measure(lambda qs=queryset: list(qs.all()), max_queries)
+
+        failures = [
+            f"{name}: {result['queries']} queries, budget {result['max_queries']}"
+            for name, result in results.items()
+            if result["queries"] > result["max_queries"]
+        ]
+        if options["baseline"]:
+            failures.extend(self._compare(results, options["baseline"], options["tolerance"]))
+
+        for name, result in results.items():
+            log(f"{name}: {result['median_ms']:.1f}ms, {result['queries']} queries")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+        if failures:
+            raise CommandError("Performance regressions:\n" + "\n".join(failures))
+
+    def _get_user(self):
+        user, _ = get_user_model().objects.get_or_create(
+            username=BENCHMARK_USERNAME, defaults={"is_staff": True, "is_superuser": True}
+        )
+        return user
+
+    def _pages(self, player_id, player_name, other_player_id):
+        match_changelist = reverse("admin:zh_match_changelist")
+        player_changelist = reverse("admin:zh_player_changelist")
+        match_id = Match.objects.values_list("id", flat=True).first()
+        return (
+            ("match changelist", match_changelist, 15),
+            ("match search", f"{match_changelist}?{urlencode({'q': player_name})}", 15),
+            ("match army filter", f"{match_changelist}?{urlencode({'players__army': 'USA'})}", 15),
+            (
+                "match player filter",
+                f"{match_changelist}?"
+                f"{urlencode({'players__player__player_name': player_name})}",
+                15,
+            ),
+            ("match change view", reverse("admin:zh_match_change", args=(match_id,)), 100),
+            ("player changelist", player_changelist, 8),
+            ("player search", f"{player_changelist}?{urlencode({'q': player_name})}", 8),
+            # Session, user, filtered and full counts, rows, two menu permission and two date
+            # hierarchy queries
+            ("job run changelist", reverse("admin:zh_jobrun_changelist"), 9),
+            ("matchup pair changelist", reverse("admin:zh_matchuppair_changelist"), 8),
+            (
+                "head-to-head api",
+                reverse("head_to_head", args=(player_id, other_player_id)),
+                4,
+            ),
+        )
+
+    def _stats_queries(self, player_id, other_player_id):
+        return (
+            (
+                "most active players",
+                Player.objects.annotate(match_count=Count("matches")).order_by("-match_count")[
+                    :50
+                ],
+                1,
+            ),
+            (
+                "army popularity",
+                MatchPlayer.objects.order_by()
+                .values("army")
+                .annotate(count=Count("id"))
+                .order_by("-count"),
+                1,
+            ),
+            (
+                "matches per map",
+                Match.objects.order_by().values("map").annotate(count=Count("id")),
+                1,
+            ),
+            (
+                "head-to-head history",
+                MatchupPair.between(player_id, other_player_id).select_related("match")[:50],
+                1,
+            ),
+        )
+
+    def _get(self, url):
+        response = self.client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def _measure(self, run, max_queries):
+        timings = []
+        for _ in range(self.repeat):
+            # Measure uncached performance, the query cache would hide regressions
+            caches[CACHE_ALIAS].clear()
+            # Routed pages and cached computations read from the replica when one is configured
+            with ExitStack() as stack:
+                contexts = {
+                    alias: stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in {DEFAULT_DB_ALIAS, replica_alias()}
+                }
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        queries = [
+            (alias, query)
+            for alias, context in contexts.items()
+            for query in context.captured_queries
+        ]
+        alias, slowest = max(queries, key=lambda q: float(q[1]["time"]), default=(None, None))
+        return {
+            "median_ms": statistics.median(timings),
+            "queries": len(queries),
+            "max_queries": max_queries,
+            "slowest_query": slowest["sql"] if slowest else None,
+            "slowest_query_database": alias,
+            "plan": self._explain(alias, slowest["sql"]) if slowest else None,
+        }
+
+    def _explain(self, alias, sql):
+        if not sql.lstrip().upper().startswith("SELECT"):
+            return None
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f"EXPLAIN {'(ANALYZE, BUFFERS) ' if self.analyze else ''}{sql}")
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def _compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        return [
+            f"{name}: {result['median_ms']:.1f}ms, baseline {baseline[name]['median_ms']:.1f}ms"
+            for name, result in results.items()
+            if name in baseline and result["median_ms"] > baseline[name]["median_ms"] * tolerance
+        ]
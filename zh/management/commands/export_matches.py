@@ -0,0 +1,107 @@
+import sys
+from pathlib import Path
+
+from dateutil.parser import isoparse
+from django.core.management import BaseCommand, CommandError
+from django.db.models import Q
+
+from zh.db_routers import replica_alias
+from zh.exports import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, ExportError, iter_match_rows, render
+from zh.models import JobRun
+
+
+class Command(BaseCommand):
+    help = "Streams matches with their players to NDJSON, CSV or Parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="ndjson")
+        parser.add_argument("--output", help="File to write to, defaults to stdout")
+        parser.add_argument("--start", type=isoparse, help="Earliest match timestamp (inclusive)")
+        parser.add_argument("--end", type=isoparse, help="Latest match timestamp (exclusive)")
+        parser.add_argument(
+            "--created-after",
+            type=isoparse,
+            help="Only export matches loaded after this timestamp",
+        )
+        parser.add_argument(
+            "--state-file",
+            help=(
+                "Only export matches of the loads completed since the export that last used this "
+                "file, then record the last of those loads in it. Matches of loads still running "
+                "are left for the next export."
+            ),
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            "--database",
+            help="Database alias to read from, defaults to the read replica when configured",
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"] or replica_alias()
+        state_file = Path(options["state_file"]) if options["state_file"] else None
+        job_run_ids = None
+        if state_file:
+            for option in ("start", "end", "created_after"):
+                if options[option]:
+                    raise CommandError(
+                        f"--{option.replace('_', '-')} cannot be combined with --state-file, "
+                        "which exports every match of the loads completed since the last export"
+                    )
+            # Loads commit their matches out of order while they run, so exports advance by
+            # completed run (as zh.cache.data_version does) rather than by match
+            job_runs = list(
+                self._completed_runs_since(state_file, using)
+                .order_by("modified_at", "id")
+                .values_list("id", "modified_at")
+            )
+            job_run_ids = [job_run_id for job_run_id, _ in job_runs]
+
+        rows = iter_match_rows(
+            start=options["start"],
+            end=options["end"],
+            created_after=options["created_after"],
+            job_run_ids=job_run_ids,
+            chunk_size=options["chunk_size"],
+            using=using,
+        )
+
+        binary = options["format"] == "parquet"
+        if options["output"]:
+            stream = (
+                open(options["output"], "wb")
+                if binary
+                else open(options["output"], "w", newline="")
+            )
+        else:
+            stream = sys.stdout.buffer if binary else sys.stdout
+
+        try:
+            for chunk in render(rows, options["format"], chunk_size=options["chunk_size"]):
+                stream.write(chunk)
+        except ExportError as e:
+            raise CommandError(str(e)) from e
+        finally:
+            if options["output"]:
+                stream.close()
+
+        if state_file and job_runs:
+            job_run_id, modified_at = job_runs[-1]
+            state_file.write_text(f"{modified_at.isoformat()} {job_run_id}\n")
+
+    def _completed_runs_since(self, state_file, using):
+        job_runs = JobRun.objects.using(using).filter(success=True)
+        if not state_file.exists():
+            return job_runs
+
+        # "<modified_at> <id>" of the last exported run. Older state files only hold a timestamp.
+        modified_at, _, job_run_id = state_file.read_text().strip().partition(" ")
+        try:
+            modified_at = isoparse(modified_at)
+        except ValueError as e:
+            raise CommandError(f"Invalid state file {state_file}: {e}") from e
+        if not job_run_id:
+            return job_runs.filter(modified_at__gt=modified_at)
+        return job_runs.filter(
+            Q(modified_at__gt=modified_at) | Q(modified_at=modified_at, id__gt=job_run_id)
+        )
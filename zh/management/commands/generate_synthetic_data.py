@@ -0,0 +1,169 @@
+import datetime
+import itertools
+import random
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from zh.gentool import match_fingerprint
+from zh.models import JobRun, Match, MatchPlayer, MatchupPair, Player
+from zh.utils import log
+
+MAPS = (
+    "tournament desert",
+    "tournament island",
+    "tournament lake",
+    "defcon 6",
+    "twilight flame",
+    "vendetta",
+    "homeland rocks",
+    "scorched earth",
+    "golden oasis",
+    "fallen empire",
+)
+ARMIES = (
+    "USA",
+    "China",
+    "GLA",
+    "Superweapon General",
+    "Laser General",
+    "Airforce General",
+    "Tank General",
+    "Infantry General",
+    "Nuke General",
+    "Toxin General",
+    "Demolition General",
+    "Stealth General",
+)
+# Players per match for each match type, weighted by how common the type is
+MATCH_TYPES = {"1v1": 2, "2v2": 4, "3v3": 6, "4v4": 8}
+MATCH_TYPE_WEIGHTS = (60, 25, 10, 5)
+STARTING_CASH = (10000, 10000, 10000, 20000, 50000)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic players and matches at production scale, with a skewed (Zipf) "
+        "distribution of matches per player, for local performance testing"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--match-players", type=int, default=100_000)
+        parser.add_argument(
+            "--players",
+            type=int,
+            help="Number of players, defaults to one per 50 match players",
+        )
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of matches per player, higher favours the most active players",
+        )
+        parser.add_argument("--days", type=int, default=730, help="Time span of the matches")
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.days = options["days"]
+        match_player_count = options["match_players"]
+        player_count = options["players"] or max(match_player_count // 50, 8)
+
+        self.job_run = JobRun.objects.create(
+            start_time=timezone.now(),
+            duration=None,
+            success=False,
+        )
+        players = self._create_players(player_count)
+        cum_weights = list(
+            itertools.accumulate(
+                1 / rank ** options["skew"] for rank in range(1, player_count + 1)
+            )
+        )
+
+        matches, match_players, pairs = [], [], []
+        created = 0
+        while created < match_player_count:
+            match, participants = self._build_match(players, cum_weights)
+            matches.append(match)
+            match_players.extend(participants)
+            pairs.extend(MatchupPair.build_for_match(match, participants))
+            created += len(participants)
+
+            if len(match_players) >= self.batch_size:
+                self._flush(matches, match_players, pairs)
+                log(f"Created {created} of {match_player_count} match players")
+                matches, match_players, pairs = [], [], []
+
+        self._flush(matches, match_players, pairs)
+        log(f"Created {created} match players across {player_count} players")
+
+        # Marked only once everything is stored, as this also invalidates cached query results
+        self.job_run.duration = timezone.now() - self.job_run.start_time
+        self.job_run.success = True
+        self.job_run.save(update_fields=["duration", "success", "modified_at"])
+
+    def _create_players(self, count):
+        players = [
+            Player(
+                job_run=self.job_run,
+                player_name=f"player_{i}",
+                gentool_id=f"{self.random.getrandbits(32):08x}",  # noqa: E231
+            )
+            for i in range(count)
+        ]
+        Player.objects.bulk_create(players, batch_size=self.batch_size)
+        log(f"Created {count} players")
+        return players
+
+    def _build_match(self, players, cum_weights):
+        match_type = self.random.choices(tuple(MATCH_TYPES), weights=MATCH_TYPE_WEIGHTS)[0]
+        size = min(MATCH_TYPES[match_type], len(players))
+        participants = {}
+        while len(participants) < size:
+            player = self.random.choices(players, cum_weights=cum_weights)[0]
+            participants[player.id] = player
+
+        match_timestamp = timezone.now() - datetime.timedelta(
+            seconds=self.random.randrange(self.days * 86400)
+        )
+        match_length = datetime.timedelta(seconds=self.random.randrange(180, 3600))
+        map_name = self.random.choice(MAPS)
+        uploader = self.random.choice(list(participants.values()))
+        replay_name = f"{self.random.getrandbits(64):x}"  # noqa: E231
+        match = Match(
+            job_run=self.job_run,
+            map=map_name,
+            replay_url=f"https://gentool.net/data/zh/synthetic/{replay_name}.rep",
+            game_version="1.04",
+            starting_cash=self.random.choice(STARTING_CASH),
+            match_length=match_length,
+            match_type=match_type,
+            match_timestamp=match_timestamp,
+            replay_size=self.random.randrange(100, 5000),
+            replay_uploaded_by=uploader,
+            replay_upload_timestamp=match_timestamp + match_length,
+            fingerprint=match_fingerprint(
+                match_timestamp,
+                map_name,
+                str(match_length),
+                [player.player_name for player in participants.values()],
+            ),
+        )
+        match_players = [
+            MatchPlayer(
+                match=match,
+                player=player,
+                team=index % 2 + 1 if size > 2 else None,
+                army=self.random.choice(ARMIES),
+            )
+            for index, player in enumerate(participants.values())
+        ]
+        return match, match_players
+
+    def _flush(self, matches, match_players, pairs):
+        Match.objects.bulk_create(matches, batch_size=self.batch_size)
+        MatchPlayer.objects.bulk_create(match_players, batch_size=self.batch_size)
+        MatchupPair.objects.bulk_create(pairs, batch_size=self.batch_size)
@@ -1,24 +1,40 @@
 import datetime
-import re
+import heapq
+import itertools
+import math
+import multiprocessing
+import os
+import queue
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
 
 import requests
-from bs4 import BeautifulSoup
-from dateutil.parser import isoparse
+from django.core.exceptions import ValidationError
 from django.core.management import BaseCommand
+from django.db import IntegrityError, connections, transaction
 from django.db.models import Max
 from django.utils import timezone
 
-from zh.models import JobRun, Match, MatchPlayer, Player
+from zh.backfill import BackfillLoader
+from zh.gentool import (
+    match_fingerprint,
+    parse_links,
+    parse_replay_file,
+    parse_replay_summary,
+    split_player_data,
+    unpack_replay_summary,
+)
+from zh.models import JobRun, Match, MatchPlayer, MatchUpload, MatchupPair, Player
+from zh.utils import log
 
 ERRORS = []
-
-
-def log(message):
-    message = f"[{timezone.now().isoformat()}] {message}"
-    print(message)
-    return message
+# Seconds between saves of a running job's errors, which are otherwise saved when it ends
+ERRORS_SAVE_INTERVAL = 60
+# Local replay summaries listed and parsed at a time by --from-dir
+LOCAL_REPLAY_WINDOW = 5000
 
 
 def log_error(message):
@@ -26,142 +42,328 @@ def log_error(message):
     ERRORS.append(message)
 
 
-class GenToolClient:
-    def __init__(self):
-        self.base_url = "https://gentool.net/data/zh"
-
-    def _get_links(
-        self,
-        data,
-        extension=None,
-        minimum_timestamp=None,
-    ):
-        if minimum_timestamp is None:
-            minimum_timestamp = datetime.datetime(1900, 1, 1).astimezone(datetime.timezone.utc)
-
-        soup = BeautifulSoup(data, "html.parser")
-        results = {}
-        for link in soup.find_all("a"):
-            name = link["href"].strip("/")
-            if link.find_parent("th") or any(prefix in name for prefix in ("data", "logs")):
-                continue
-            if extension and not name.endswith(extension):
-                continue
-            row = link.find_parent("tr")
-            timestamp = isoparse(
-                f"{row.find_all('td')[2].text.strip()}:00"  # NOQA E231
-            ).astimezone(datetime.timezone.utc)
-            if timestamp is None or timestamp >= minimum_timestamp:
-                results[name] = timestamp
-
-        return dict(sorted(results.items(), key=lambda item: item[1]))  # Sort by timestamp
-
-    def _parse_replay_data(self, data):
-        # Initialize the dictionary to store extracted fields
-        extracted_data = {}
-
-        # Define regex patterns for the required fields
-        patterns = {
-            "game_version": r"Game Version:\s+Zero Hour ([\d.]+)",
-            "map": r"Map Name:\s+(?:maps/)?(.+)",
-            "starting_cash": r"Start Cash:\s+(\d+)",
-            "match_length": r"Match Length:\s+([\d:]+)",
-            "match_type": r"Match Type:\s+(.+)",
-            "match_timestamp": r"Match Date \(UTC\):\s+(.+)",
-            "replay_size": r"\.rep \[(\d+) bytes\]",
-        }
-
-        # Extract individual fields using regex
-        for key, pattern in patterns.items():
-            match = re.search(pattern, data)
-            value = match.group(1) if match else None
-
-            if key == "match_timestamp" and value:
-                try:
-                    value = datetime.datetime.strptime(value, "%Y %b %d, %H:%M:%S").astimezone(
-                        datetime.timezone.utc
-                    )
-                except ValueError as e:
-                    log(f"Error parsing date: {e}")
-                    value = None
-            if key == "game_version" and not value:
-                value = "Unknown"
-
-            if key == "rep_file_size" and value:
-                value = int(value) / 1024  # Convert file size to an integer in KB
-
-            extracted_data[key] = value
-
-        # Regex patterns for teams and players
-        team_pattern = r"Team (\d+)\n((?:\s+\S+ -?\S+ \([^)]+\)\n?)+)"
-        player_pattern = r"^\s*\S+\s+(-?\S+)\s\(([^)]+)\)$"
-
-        # Extract teams and players
-        teams = {}
-        for team_match in re.finditer(team_pattern, data, re.MULTILINE):
-            team_number = int(team_match.group(1))
-            team_players = team_match.group(2)
+def is_congestion(error):
+    """Whether a failed request means gentool.net is overloaded, not e.g. a missing file."""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
 
-            players = re.findall(player_pattern, team_players, re.MULTILINE)
-            teams[team_number] = [{"player_name": name, "army": army} for name, army in players]
 
-        # Extract players without a team (if any)
-        no_team_section = data.split("Team ")[0]
-        no_team_players = re.findall(player_pattern, no_team_section, re.MULTILINE)
+class AdaptiveScheduler:
+    """
+    Bounds in-flight gentool.net requests with an AIMD limit: the limit grows by one for every
+    window of `limit` requests that succeed within `target_latency` seconds, and halves (at most
+    once per `target_latency`) when a request is slower or fails from congestion (see
+    `is_congestion`, a missing file is not a reason to back off). The limit never exceeds
+    `max_concurrency`, requests start at most `max_requests_per_second` apart, and waiting
+    requests are released lowest `priority` first.
+    """
 
-        # Prepare the final list of players
-        extracted_data["players"] = []
-
-        # Add team players to the final list
-        for team_number, players in teams.items():
-            for player in players:
-                player["team"] = team_number
-                extracted_data["players"].append(player)
+    def __init__(
+        self,
+        max_concurrency,
+        initial_concurrency=16,
+        max_requests_per_second=None,
+        target_latency=2.0,
+        backoff=0.5,
+    ):
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self._interval = 1 / max_requests_per_second if max_requests_per_second else 0
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._next_start = 0.0
+        self._last_decrease = 0.0
+
+    @contextmanager
+    def request(self, priority=0):
+        self._acquire(priority)
+        started = time.monotonic()
+        congested = False
+        try:
+            yield
+        except Exception as e:
+            congested = is_congestion(e)
+            raise
+        finally:
+            self._release(time.monotonic() - started, congested)
+
+    def _acquire(self, priority):
+        with self._condition:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, entry)
+            while self._waiters[0] != entry or self._in_flight >= int(self.limit):
+                self._condition.wait()
+            heapq.heappop(self._waiters)
+            self._in_flight += 1
+
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self._interval
+            self._condition.notify_all()
+        if start > now:
+            time.sleep(start - now)
+
+    def _release(self, latency, congested):
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if congested or latency > self.target_latency:
+                if now - self._last_decrease > self.target_latency:
+                    self.limit = max(1.0, self.limit * self.backoff)
+                    self._last_decrease = now
+                    log(f"Reduced gentool.net concurrency to {int(self.limit)} ({latency=:.2f})")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._condition.notify_all()
 
-        # Add no-team players (with team set to None)
-        for name, army in no_team_players:
-            extracted_data["players"].append({"player_name": name, "army": army, "team": None})
 
-        return extracted_data
+class GenToolClient:
+    def __init__(self, parse_pool=None, scheduler=None, timeout=30):
+        self.base_url = "https://gentool.net/data/zh"
+        self.parse_pool = parse_pool
+        self.scheduler = scheduler
+        self.timeout = timeout
+
+    def _get(self, url, priority=0):
+        if self.scheduler is None:
+            return self._fetch(url)
+        with self.scheduler.request(priority):
+            return self._fetch(url)
+
+    def _fetch(self, url):
+        response = requests.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    def _parse(self, function, *args):
+        # Parsing is CPU-bound, so it runs in the parse process pool when one is attached and
+        # fetch threads only wait on the (compact) result
+        if self.parse_pool is None:
+            return function(*args)
+        return self.parse_pool.submit(function, *args).result()
+
+    def _get_links(self, data, extension=None):
+        return dict(self._parse(parse_links, data, extension))
 
     def list_months(self, minimum_timestamp=None):
         log(f"Listing months from {self.base_url} with {minimum_timestamp=}")
-        return [
-            m for m in list(sorted(self._get_links(requests.get(f"{self.base_url}").text).keys()))
-        ]
+        return [m for m in list(sorted(self._get_links(self._get(f"{self.base_url}", -1)).keys()))]
 
     def list_days(self, month, minimum_timestamp=None):
         url = f"{self.base_url}/{month}"
         log(f"Listing days from {url} with {minimum_timestamp=}")
-        return list(sorted(self._get_links(requests.get(url).text)))
+        return list(sorted(self._get_links(self._get(url, -1))))
 
-    def list_players(self, month, day, minimum_timestamp=None):
+    def list_players(self, month, day, minimum_timestamp=None, priority=0):
         url = f"{self.base_url}/{month}/{day}"
         log(f"Listing players from {url} with {minimum_timestamp=}")
-        return self._get_links(requests.get(url).text)
+        return self._get_links(self._get(url, priority))
 
-    def list_matches(self, month, day, player, minimum_timestamp=None):
+    def list_matches(self, month, day, player, minimum_timestamp=None, priority=0):
         url = f"{self.base_url}/{month}/{day}/{player}"
         log(f"Listing matches from {url} with minimum_timestamp={minimum_timestamp}")
-        return self._get_links(requests.get(url).text, ".txt")
+        return self._get_links(self._get(url, priority), ".txt")
 
-    def get_match_data(self, month, day, player, match):
+    def get_match_data(self, month, day, player, match, priority=0):
         url = f"{self.base_url}/{month}/{day}/{player}/{match}"
         log(f"Getting match data from {url}")
-        return self._parse_replay_data(requests.get(url).text)
+        return self._parse(parse_replay_summary, self._get(url, priority))
+
+    def replay_url(self, month, day, player, match):
+        return f"{self.base_url}/{month}/{day}/{player}/{match}".replace(".txt", ".rep")
+
+
+class PriorityExecutor:
+    """
+    Runs tasks on `size` threads, lowest `priority` first and in submission order among equal
+    priorities. Unlike ThreadPoolExecutor's FIFO queue, this lets the tasks a crawl step submits
+    for a newer day run before the steps still queued for older days.
+    """
+
+    def __init__(self, size):
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"crawler-{i}", daemon=True)
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.shutdown()
+
+    def submit(self, priority, function, *args, **kwargs):
+        future = Future()
+        self._queue.put((priority, next(self._sequence), (future, function, args, kwargs)))
+        return future
+
+    def shutdown(self):
+        # Sentinels sort after any pending work, so that work is finished first
+        for _ in self._threads:
+            self._queue.put((math.inf, next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        while (item := self._queue.get()[2]) is not None:
+            future, function, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class DatabaseWriter:
+    """
+    Runs ORM work on a fixed set of threads, so the loader holds at most `size` database
+    connections however many crawler threads feed it. Each thread closes its connections when the
+    writer shuts down.
+    """
+
+    def __init__(self, size, queue_size=10000):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"db-writer-{i}", daemon=True)
+            for i in range(size)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.shutdown()
+
+    def submit(self, function, *args, **kwargs):
+        future = Future()
+        self._queue.put((future, function, args, kwargs))
+        return future
+
+    def shutdown(self):
+        # Sentinels are queued behind any pending work, so that work is finished first
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self):
+        try:
+            while (item := self._queue.get()) is not None:
+                future, function, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(function(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            connections.close_all()
 
 
 class Command(BaseCommand):
-    def __init__(self):
+    help = "Loads GenTool match data from gentool.net or from a local copy of its directory tree"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.gentool = GenToolClient()
         self.start_time = time.time()
         self.last_loaded_timestamp = None
         self.futures = []
+        self.backfill = None
+        self.errors_saved_at = self.start_time
+        self.status_lock = threading.Lock()
+        self.player_lock = threading.Lock()
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--from-dir",
+            type=Path,
+            help=(
+                "Load `.txt` replay summaries from a local directory laid out like gentool.net "
+                "(month/day/<player>_<gentool_id>/) instead of crawling the site"
+            ),
+        )
+        parser.add_argument(
+            "--parse-workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of processes parsing listings and replay summaries",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=450,
+            help="Number of threads fetching listings and replays from gentool.net",
+        )
+        parser.add_argument(
+            "--initial-concurrency",
+            type=int,
+            default=16,
+            help="Concurrent gentool.net requests to start with, adapted up to --workers",
+        )
+        parser.add_argument(
+            "--max-requests-per-second",
+            type=float,
+            default=100,
+            help="Upper bound on the rate of requests to gentool.net",
+        )
+        parser.add_argument(
+            "--backfill",
+            action="store_true",
+            help=(
+                "Stage parsed replays with COPY and merge them in bulk at the end, for large "
+                "re-imports"
+            ),
+        )
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="With --backfill, drop secondary indexes during the merge and rebuild them after",
+        )
+        parser.add_argument(
+            "--backfill-batch-size",
+            type=int,
+            default=5000,
+            help="Number of matches staged per COPY",
+        )
+        parser.add_argument(
+            "--db-workers",
+            type=int,
+            default=4,
+            help="Number of threads (and so database connections) writing to the database",
+        )
 
-    def _update_run_status(self):
-        self.current_run.duration = datetime.timedelta(seconds=int(time.time() - self.start_time))
-        self.current_run.logs = ERRORS
-        self.current_run.save()
+    def _update_run_status(self, final=False):
+        """
+        Saves the run's duration. Called after every stored match, from several writer threads,
+        so the ever-growing errors array is only rewritten periodically and at the end.
+        """
+        update_fields = ["duration", "modified_at"]
+        with self.status_lock:
+            if final or time.time() - self.errors_saved_at >= ERRORS_SAVE_INTERVAL:
+                self.current_run.errors = list(ERRORS)
+                self.errors_saved_at = time.time()
+                update_fields.append("errors")
+            if final:
+                update_fields.append("success")
+            self.current_run.duration = datetime.timedelta(
+                seconds=int(time.time() - self.start_time)
+            )
+            self.current_run.save(update_fields=update_fields)
         log(
             f"Updating job run {self.current_run} with duration={self.current_run.duration} and "
             f"{len(ERRORS)} errors"
@@ -175,45 +377,120 @@ class Command(BaseCommand):
         player,
         match_info,
         replay_upload_timestamp,
+        priority,
     ):
-        match_data = self.gentool.get_match_data(month, day, player_data, match_info)
-        match_players = match_data.pop("players")
-        replay_url = f"{self.gentool.base_url}/{month}/{day}/{player_data}/{match_info}".replace(
-            # NOQA E501
-            ".txt",
-            ".rep",
+        match_data = self.gentool.get_match_data(
+            month, day, player_data, match_info, priority=priority
         )
+        self.futures.append(
+            self.db.submit(
+                self._save_match,
+                self.gentool.replay_url(month, day, player_data, match_info),
+                player_data,
+                player,
+                replay_upload_timestamp,
+                match_data,
+            )
+        )
+
+    def _known_replay_urls(self, replay_urls):
+        """Returns the given replay URLs that are already stored, as a match or an alternate."""
+        known = set()
+        for batch in itertools.batched(replay_urls, 1000):
+            known.update(
+                Match.objects.filter(replay_url__in=batch).values_list("replay_url", flat=True)
+            )
+            known.update(
+                MatchUpload.objects.filter(replay_url__in=batch).values_list(
+                    "replay_url", flat=True
+                )
+            )
+        return known
 
-        if Match.objects.filter(replay_url=replay_url).exists():
+    def _store_match(
+        self, replay_url, player_data, player, replay_upload_timestamp, replay_summary
+    ):
+        match_data = unpack_replay_summary(replay_summary)
+        match_players = match_data.pop("players")
+
+        if self._known_replay_urls([replay_url]):
             return
 
+        fingerprint = match_fingerprint(
+            match_data["match_timestamp"],
+            match_data["map"],
+            match_data["match_length"],
+            [match_player["player_name"] for match_player in match_players],
+        )
+        # Without a fingerprint the lookups below would match any match stored without one
+        if fingerprint is None:
+            raise ValueError(f"Cannot load {replay_url}, missing match_timestamp")
+
+        canonical_match = Match.objects.filter(fingerprint=fingerprint).first()
+        if canonical_match is None:
+            # Resolved before the transaction, so players created here are visible to the other
+            # writer threads right away rather than once the match is committed
+            uploader_name, _ = split_player_data(player_data)
+            players = {
+                match_player["player_name"]: self._get_player(
+                    match_player["player_name"], player, uploader_name
+                )
+                for match_player in match_players
+            }
+            try:
+                with transaction.atomic():
+                    self._create_match(
+                        replay_url,
+                        player,
+                        replay_upload_timestamp,
+                        fingerprint,
+                        match_data,
+                        match_players,
+                        players,
+                    )
+            except (IntegrityError, ValidationError):
+                # Another writer may have stored the same game from a different upload meanwhile
+                canonical_match = Match.objects.filter(fingerprint=fingerprint).first()
+                if canonical_match is None:
+                    raise
+            else:
+                self._update_run_status()
+                return
+
+        MatchUpload.objects.create(
+            match=canonical_match,
+            uploaded_by=player,
+            replay_url=replay_url,
+            replay_upload_timestamp=replay_upload_timestamp,
+        )
+        log(f"Recorded {replay_url} as an alternate upload of {canonical_match.replay_url}")
+
+    def _create_match(
+        self,
+        replay_url,
+        player,
+        replay_upload_timestamp,
+        fingerprint,
+        match_data,
+        match_players,
+        players,
+    ):
         match = Match.objects.create(
             job_run=self.current_run,
             replay_url=replay_url,
             replay_uploaded_by=player,
             replay_upload_timestamp=replay_upload_timestamp,
+            fingerprint=fingerprint,
             **match_data,
         )
         log(f"Created match: {replay_url}")
 
         match_player_objects = []
         for match_player in match_players:
-            if match_player["player_name"] == player.player_name:
-                player_object = player
-            else:
-                player_object = Player.objects.filter(
-                    player_name=match_player["player_name"]
-                ).first()
-                if not player:
-                    player_object = Player.objects.create(
-                        job_run=self.current_run, player_name=match_player["player_name"]
-                    )
-                    log(f"Created player: {match_player['player_name']}")
-
             match_player_objects.append(
                 MatchPlayer(
                     match=match,
-                    player=player_object,
+                    player=players[match_player["player_name"]],
                     team=match_player["team"],
                     army=match_player["army"],
                 )
@@ -223,13 +500,28 @@ class Command(BaseCommand):
             )
 
         MatchPlayer.objects.bulk_create(match_player_objects)
+        MatchupPair.objects.bulk_create(MatchupPair.build_for_match(match, match_player_objects))
+
+    def _get_player(self, player_name, uploader, uploader_name):
+        # The participant named like the upload folder is the uploader, even if their gentool
+        # id's player was stored under the name they used before renaming
+        if player_name == uploader_name:
+            return uploader
+
+        # Writer threads would otherwise race to create the same player
+        with self.player_lock:
+            player = Player.objects.filter(player_name=player_name).first()
+            if not player:
+                player = Player.objects.create(job_run=self.current_run, player_name=player_name)
+                log(f"Created player: {player_name}")
+        return player
 
-        self._update_run_status()
+    def _get_uploader(self, player_data):
+        with self.player_lock:
+            return self._get_or_create_uploader(player_data)
 
-    def _process_day(self, month, day, player_data):
-        parts = player_data.split("_")
-        gentool_id = parts[-1]
-        name = "_".join(parts[:-1])
+    def _get_or_create_uploader(self, player_data):
+        name, gentool_id = split_player_data(player_data)
 
         player = Player.objects.filter(gentool_id=gentool_id).first()
         if player is None:
@@ -246,11 +538,46 @@ class Command(BaseCommand):
             player.save()
             log(f"Updated player: {name} with {gentool_id=}")
 
-        for match_info, replay_upload_timestamp in self.gentool.list_matches(
-            month, day, player_data, minimum_timestamp=self.last_loaded_timestamp
-        ).items():
+        return player
+
+    def _resolve_uploader(self, player_data):
+        # Backfills resolve players in bulk from the folder names when merging
+        if self.backfill:
+            return None
+        return self.db.submit(self._get_uploader, player_data).result()
+
+    def _save_match(
+        self, replay_url, player_data, player, replay_upload_timestamp, replay_summary
+    ):
+        if self.backfill:
+            self.backfill.add(replay_url, player_data, replay_upload_timestamp, replay_summary)
+        else:
+            self._store_match(
+                replay_url, player_data, player, replay_upload_timestamp, replay_summary
+            )
+
+    def _process_day(self, month, day, player_data, priority):
+        player = self._resolve_uploader(player_data)
+
+        matches = self.gentool.list_matches(
+            month,
+            day,
+            player_data,
+            minimum_timestamp=self.last_loaded_timestamp,
+            priority=priority,
+        )
+        # Skip fetching replays already stored, including other participants' copies
+        known_replay_urls = self.db.submit(
+            self._known_replay_urls,
+            [self.gentool.replay_url(month, day, player_data, m) for m in matches],
+        ).result()
+
+        for match_info, replay_upload_timestamp in matches.items():
+            if self.gentool.replay_url(month, day, player_data, match_info) in known_replay_urls:
+                continue
             self.futures.append(
                 self.executor.submit(
+                    priority,
                     self._process_match,
                     month,
                     day,
@@ -258,16 +585,85 @@ class Command(BaseCommand):
                     player,
                     match_info,
                     replay_upload_timestamp,
+                    priority,
                 )
             )
 
-    def _process_players(self, month, day):
+    def _process_players(self, month, day, priority):
         for player_data in self.gentool.list_players(
-            month, day, minimum_timestamp=self.last_loaded_timestamp
+            month, day, minimum_timestamp=self.last_loaded_timestamp, priority=priority
+        ):
+            self.futures.append(
+                self.executor.submit(
+                    priority, self._process_day, month, day, player_data, priority
+                )
+            )
+
+    def _crawl(self):
+        # Newest days first, so incremental runs are done quickly and backfills store the most
+        # recent games before older ones. A day's priority is its position in that order, and
+        # every task and request made for the day inherits it.
+        priorities = itertools.count()
+        for month in reversed(
+            self.gentool.list_months(minimum_timestamp=self.last_loaded_timestamp)
         ):
-            self.futures.append(self.executor.submit(self._process_day, month, day, player_data))
+            for day in reversed(
+                self.gentool.list_days(month, minimum_timestamp=self.last_loaded_timestamp)
+            ):
+                priority = next(priorities)
+                self.futures.append(
+                    self.executor.submit(priority, self._process_players, month, day, priority)
+                )
 
-    def handle(self, *args, **kwargs):
+    def _list_local_replays(self, root):
+        for month in sorted(p for p in root.iterdir() if p.is_dir()):
+            for day in sorted(p for p in month.iterdir() if p.is_dir()):
+                for player_dir in sorted(p for p in day.iterdir() if p.is_dir()):
+                    for path in sorted(player_dir.glob("*.txt")):
+                        yield month.name, day.name, player_dir.name, path
+
+    def _load_from_dir(self, root, parse_pool):
+        # Replays are listed, checked and parsed a window at a time. Saving blocks once the
+        # writers' queue is full, so parsed summaries never pile up while the writers catch up.
+        uploaders = {}
+        for replays in itertools.batched(self._list_local_replays(root), LOCAL_REPLAY_WINDOW):
+            replay_urls = [
+                self.gentool.replay_url(month, day, player_data, path.name)
+                for month, day, player_data, path in replays
+            ]
+            known_replay_urls = self.db.submit(self._known_replay_urls, replay_urls).result()
+            replays = [
+                (replay_url, player_data, path)
+                for replay_url, (_, _, player_data, path) in zip(replay_urls, replays)
+                if replay_url not in known_replay_urls
+            ]
+            log(f"Loading {len(replays)} replay summaries from {root}")
+
+            # Each file is parsed on its own, so one unreadable replay is logged and skipped
+            parsed = [parse_pool.submit(parse_replay_file, str(path)) for *_, path in replays]
+            for (replay_url, player_data, path), parse_future in zip(replays, parsed):
+                try:
+                    replay_summary = parse_future.result()
+                    replay_upload_timestamp = datetime.datetime.fromtimestamp(
+                        path.stat().st_mtime, tz=datetime.timezone.utc
+                    )
+                except Exception as e:
+                    log_error(f"Error reading replay {path}: {e}")
+                    continue
+                if player_data not in uploaders:
+                    uploaders[player_data] = self._resolve_uploader(player_data)
+                self.futures.append(
+                    self.db.submit(
+                        self._save_match,
+                        replay_url,
+                        player_data,
+                        uploaders[player_data],
+                        replay_upload_timestamp,
+                        replay_summary,
+                    )
+                )
+
+    def handle(self, *args, **options):
         self.last_loaded_timestamp = Match.objects.aggregate(Max("replay_upload_timestamp"))[
             "replay_upload_timestamp__max"
         ]
@@ -278,20 +674,54 @@ class Command(BaseCommand):
             success=False,
         )
 
-        with ThreadPoolExecutor(max_workers=450) as self.executor:
-            for month in self.gentool.list_months(minimum_timestamp=self.last_loaded_timestamp):
-                for day in self.gentool.list_days(
-                    month, minimum_timestamp=self.last_loaded_timestamp
-                ):
-                    self.futures.append(self.executor.submit(self._process_players, month, day))
+        if options["backfill"]:
+            self.backfill = BackfillLoader(
+                self.current_run,
+                batch_size=options["backfill_batch_size"],
+                defer_indexes=options["defer_indexes"],
+            )
+            self.backfill.create_staging_tables()
 
-            self.current_run.success = True
+        # Parse workers are started from a clean forkserver rather than forked from this
+        # multi-threaded process with open database connections
+        parse_pool = ProcessPoolExecutor(
+            max_workers=options["parse_workers"],
+            mp_context=multiprocessing.get_context("forkserver"),
+        )
+        # Crawler threads never touch the ORM, so the number of database connections is bounded
+        # by --db-workers (plus this thread) independently of --workers
+        with (
+            parse_pool,
+            DatabaseWriter(options["db_workers"]) as self.db,
+            PriorityExecutor(options["workers"]) as self.executor,
+        ):
+            self.gentool.parse_pool = parse_pool
+            self.gentool.scheduler = AdaptiveScheduler(
+                max_concurrency=options["workers"],
+                initial_concurrency=options["initial_concurrency"],
+                max_requests_per_second=options["max_requests_per_second"],
+            )
+            if options["from_dir"]:
+                self._load_from_dir(options["from_dir"], parse_pool)
+            else:
+                self._crawl()
 
-            for future in as_completed(self.futures):
+            # Tasks submit further tasks before they finish, so walking the list while it grows
+            # waits for all of them before the executors above are shut down
+            index = 0
+            while index < len(self.futures):
                 try:
-                    future.result()
+                    self.futures[index].result()
                 except Exception as e:
                     log_error(f"Error processing future: {e}")
+                index += 1
+
+        if self.backfill:
+            self.backfill.flush()
+            self.backfill.merge()
+            self.backfill.drop_staging_tables()
 
-        self._update_run_status()
+        # Marked only once everything is stored, as this also invalidates cached query results
+        self.current_run.success = True
+        self._update_run_status(final=True)
         log(f"Job completed successfully in {self.current_run.duration}")
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:46
+
+from django.db import migrations, models
+
+import zh.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zh", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="jobrun",
+            name="id",
+            field=models.UUIDField(
+                default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+            ),
+        ),
+        migrations.AlterField(
+            model_name="match",
+            name="id",
+            field=models.UUIDField(
+                default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+            ),
+        ),
+        migrations.AlterField(
+            model_name="matchplayer",
+            name="id",
+            field=models.UUIDField(
+                default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+            ),
+        ),
+        migrations.AlterField(
+            model_name="player",
+            name="id",
+            field=models.UUIDField(
+                default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+            ),
+        ),
+    ]
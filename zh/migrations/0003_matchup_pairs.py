@@ -0,0 +1,76 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import zh.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zh", "0002_time_ordered_ids"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MatchupPair",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+                ("same_team", models.BooleanField()),
+                ("match_timestamp", models.DateTimeField()),
+                (
+                    "match",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="matchup_pairs",
+                        to="zh.match",
+                    ),
+                ),
+                (
+                    "player_a",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="zh.player",
+                    ),
+                ),
+                (
+                    "player_b",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="zh.player",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("-match_timestamp",),
+                "indexes": [
+                    models.Index(
+                        fields=["player_a", "player_b", "-match_timestamp"],
+                        name="matchup_pair_history",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="matchuppair",
+            constraint=models.UniqueConstraint(
+                fields=("player_a", "player_b", "match"), name="unique_matchup_pair"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="matchuppair",
+            constraint=models.CheckConstraint(
+                check=models.Q(("player_a__lt", models.F("player_b"))), name="ordered_matchup_pair"
+            ),
+        ),
+    ]
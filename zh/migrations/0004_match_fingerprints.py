@@ -0,0 +1,74 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import zh.utils
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("zh", "0003_matchup_pairs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="match",
+            name="fingerprint",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Identifies the same game uploaded by different participants",
+                max_length=64,
+                null=True,
+                unique=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="match",
+            name="replay_url",
+            field=models.URLField(db_index=True, max_length=500),
+        ),
+        migrations.CreateModel(
+            name="MatchUpload",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=zh.utils.uuid7, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("modified_at", models.DateTimeField(auto_now=True)),
+                ("replay_url", models.URLField(max_length=500, unique=True)),
+                ("replay_upload_timestamp", models.DateTimeField(null=True)),
+                (
+                    "match",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="alternate_uploads",
+                        to="zh.match",
+                    ),
+                ),
+                (
+                    "uploaded_by",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="zh.player",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("replay_upload_timestamp",),
+            },
+        ),
+        migrations.AddField(
+            model_name="match",
+            name="alternate_uploaders",
+            field=models.ManyToManyField(
+                related_name="alternate_uploaded_matches", through="zh.MatchUpload", to="zh.player"
+            ),
+        ),
+    ]
@@ -1,12 +1,14 @@
-from uuid import uuid4
+from itertools import combinations
 
 from django.contrib.postgres.fields import ArrayField
 from django.db import models
 from django.utils import timezone
 
+from zh.utils import uuid7
+
 
 class BaseModel(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, db_index=True, editable=False)
     modified_at = models.DateTimeField(auto_now=True, editable=False)
 
@@ -55,7 +57,7 @@ class Player(BaseModel):
 class Match(BaseModel):
     job_run = models.ForeignKey(to=JobRun, on_delete=models.CASCADE, related_name="matches")
     map = models.CharField(max_length=255)
-    replay_url = models.URLField(max_length=500)
+    replay_url = models.URLField(max_length=500, db_index=True)
     game_version = models.CharField(max_length=10)
     starting_cash = models.IntegerField()
     match_length = models.DurationField()
@@ -66,6 +68,20 @@ class Match(BaseModel):
         to=Player, on_delete=models.CASCADE, related_name="uploaded_matches"
     )
     replay_upload_timestamp = models.DateTimeField(null=True)
+    fingerprint = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Identifies the same game uploaded by different participants",
+    )
+    alternate_uploaders = models.ManyToManyField(
+        to=Player,
+        through="MatchUpload",
+        through_fields=("match", "uploaded_by"),
+        related_name="alternate_uploaded_matches",
+    )
 
     class Meta:
         ordering = ("-created_at",)
@@ -75,6 +91,21 @@ class Match(BaseModel):
         return "__".join(p.player.player_name for p in self.players.all())
 
 
+class MatchUpload(BaseModel):
+    """Another participant's upload of a game already stored as `match`."""
+
+    match = models.ForeignKey(to=Match, on_delete=models.CASCADE, related_name="alternate_uploads")
+    uploaded_by = models.ForeignKey(to=Player, on_delete=models.CASCADE, related_name="+")
+    replay_url = models.URLField(max_length=500, unique=True)
+    replay_upload_timestamp = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ("replay_upload_timestamp",)
+
+    def __str__(self):
+        return self.replay_url
+
+
 class MatchPlayer(BaseModel):
     match = models.ForeignKey(to=Match, on_delete=models.CASCADE, related_name="players")
     player = models.ForeignKey(to=Player, on_delete=models.CASCADE, related_name="matches")
@@ -86,3 +117,64 @@ class MatchPlayer(BaseModel):
 
     def __str__(self):
         return f"{self.player.player_name} ({self.army} - Team {self.team})"
+
+
+class MatchupPair(BaseModel):
+    """
+    One row per pair of players that took part in the same match, with `player_a` always holding
+    the lower id, so the history between two players is a single range scan on the
+    (player_a, player_b, match_timestamp) index.
+    """
+
+    player_a = models.ForeignKey(to=Player, on_delete=models.CASCADE, related_name="+")
+    player_b = models.ForeignKey(to=Player, on_delete=models.CASCADE, related_name="+")
+    match = models.ForeignKey(to=Match, on_delete=models.CASCADE, related_name="matchup_pairs")
+    same_team = models.BooleanField()
+    match_timestamp = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-match_timestamp",)
+        constraints = (
+            models.UniqueConstraint(
+                fields=("player_a", "player_b", "match"), name="unique_matchup_pair"
+            ),
+            models.CheckConstraint(
+                check=models.Q(player_a__lt=models.F("player_b")), name="ordered_matchup_pair"
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=("player_a", "player_b", "-match_timestamp"), name="matchup_pair_history"
+            ),
+        )
+
+    def __str__(self):
+        return f"{self.player_a} vs {self.player_b} ({self.match_timestamp})"
+
+    @classmethod
+    def ordered(cls, player_id, other_player_id):
+        return tuple(sorted((player_id, other_player_id)))
+
+    @classmethod
+    def build_for_match(cls, match, match_players):
+        """Returns unsaved pairs for every two distinct players in `match_players`."""
+        players = {}
+        for match_player in match_players:
+            players.setdefault(match_player.player_id, match_player.team)
+
+        return [
+            cls(
+                player_a_id=player_a_id,
+                player_b_id=player_b_id,
+                match=match,
+                same_team=players[player_a_id] is not None
+                and players[player_a_id] == players[player_b_id],
+                match_timestamp=match.match_timestamp,
+            )
+            for player_a_id, player_b_id in combinations(sorted(players), 2)
+        ]
+
+    @classmethod
+    def between(cls, player_id, other_player_id):
+        player_a_id, player_b_id = cls.ordered(player_id, other_player_id)
+        return cls.objects.filter(player_a_id=player_a_id, player_b_id=player_b_id)
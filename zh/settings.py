@@ -63,6 +63,31 @@ ROOT_URLCONF = "zh.urls"
 WSGI_APPLICATION = "zh.wsgi.application"
 
 DATABASES = {"default": {**dj_database_url.config(), "CONN_MAX_AGE": 30}}
+if os.getenv("REPLICA_DATABASE_URL"):
+    DATABASES["replica"] = {
+        **dj_database_url.parse(os.environ["REPLICA_DATABASE_URL"]),
+        "CONN_MAX_AGE": 30,
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_ROUTERS = ["zh.db_routers.PrimaryReplicaRouter"]
+
+# Read query results cached by zh.cache. Keys are versioned by the latest successful JobRun, so
+# entries never need to expire on their own; the local memory backend evicts least recently used
+# entries once MAX_ENTRIES is reached.
+QUERY_CACHE_DIR = os.getenv("QUERY_CACHE_DIR")
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "queries": {
+        "BACKEND": (
+            "django.core.cache.backends.filebased.FileBasedCache"
+            if QUERY_CACHE_DIR
+            else "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": QUERY_CACHE_DIR or "queries",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "5000"))},
+    },
+}
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
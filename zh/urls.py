@@ -1,6 +1,15 @@
 from django.contrib import admin
 from django.urls import path
 
+from zh import views
+
 urlpatterns = [
+    path("api/export/matches/", views.export_matches, name="export_matches"),
+    path(
+        "api/head-to-head/<uuid:player_id>/<uuid:other_player_id>/",
+        views.head_to_head,
+        name="head_to_head",
+    ),
+    path("api/cache-stats/", views.query_cache_stats, name="query_cache_stats"),
     path("", admin.site.urls),
 ]
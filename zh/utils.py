@@ -1,4 +1,13 @@
+import os
+import threading
+import time
 from decimal import Decimal
+from uuid import UUID
+
+from django.utils import timezone
+
+_uuid7_lock = threading.Lock()
+_uuid7_last = (0, 0)
 
 
 def format_currency(amount, currency="USD"):
@@ -6,3 +15,42 @@ def format_currency(amount, currency="USD"):
         amount = Decimal(0)
     prefix = "$" if currency == "USD" else ""
     return f"{prefix}{amount:,.2f} {currency}"  # noqa: E231
+
+
+def log(message):
+    message = f"[{timezone.now().isoformat()}] {message}"
+    print(message)
+    return message
+
+
+def uuid7():
+    """
+    Returns a time-ordered UUID (RFC 9562 version 7).
+
+    The first 48 bits hold the Unix timestamp in milliseconds, so ids generated later sort after
+    ids generated earlier and new rows land on the right edge of the primary key index. The 12
+    bits following the version act as a counter so ids minted within the same millisecond by
+    this process remain monotonic.
+    """
+    global _uuid7_last
+
+    with _uuid7_lock:
+        timestamp_ms = time.time_ns() // 1_000_000
+        last_timestamp_ms, last_counter = _uuid7_last
+        if timestamp_ms <= last_timestamp_ms:
+            timestamp_ms = last_timestamp_ms
+            counter = last_counter + 1
+            if counter > 0xFFF:  # Counter exhausted, borrow the next millisecond
+                timestamp_ms += 1
+                counter = 0
+        else:
+            counter = 0
+        _uuid7_last = (timestamp_ms, counter)
+
+    random_bits = int.from_bytes(os.urandom(8), "big") & 0x3FFF_FFFF_FFFF_FFFF
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76  # Version
+    value |= counter << 64
+    value |= 0b10 << 62  # Variant
+    value |= random_bits
+    return UUID(int=value)
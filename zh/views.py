@@ -0,0 +1,98 @@
+from dateutil.parser import isoparse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Count, Q
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+
+from zh.cache import cache_stats, cached_query
+from zh.db_routers import replica_alias
+from zh.exports import CONTENT_TYPES, DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, iter_match_rows, render
+from zh.models import MatchupPair
+
+HEAD_TO_HEAD_MAX_LIMIT = 500
+
+
+def _parse_timestamp_param(request, name):
+    value = request.GET.get(name)
+    return isoparse(value) if value else None
+
+
+@staff_member_required
+def export_matches(request):
+    export_format = request.GET.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    try:
+        start = _parse_timestamp_param(request, "start")
+        end = _parse_timestamp_param(request, "end")
+        created_after = _parse_timestamp_param(request, "created_after")
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid timestamp: {e}")
+
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return HttpResponseBadRequest("Parquet exports require the parquet extra (pyarrow)")
+
+    rows = iter_match_rows(
+        start=start,
+        end=end,
+        created_after=created_after,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        using=replica_alias(),
+    )
+    response = StreamingHttpResponse(
+        render(rows, export_format), content_type=CONTENT_TYPES[export_format]
+    )
+    response["Content-Disposition"] = f'attachment; filename="matches.{export_format}"'
+    return response
+
+
+@staff_member_required
+def head_to_head(request, player_id, other_player_id):
+    if player_id == other_player_id:
+        return HttpResponseBadRequest("A player cannot be matched up against themselves")
+    try:
+        limit = min(int(request.GET.get("limit", 50)), HEAD_TO_HEAD_MAX_LIMIT)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+
+    return JsonResponse(
+        cached_query(
+            f"head_to_head:{player_id}:{other_player_id}:{limit}",
+            lambda: _head_to_head(player_id, other_player_id, limit),
+        )
+    )
+
+
+def _head_to_head(player_id, other_player_id, limit):
+    pairs = MatchupPair.between(player_id, other_player_id)
+    counts = pairs.aggregate(
+        total=Count("id"),
+        together=Count("id", filter=Q(same_team=True)),
+        against=Count("id", filter=Q(same_team=False)),
+    )
+    matches = [
+        {
+            "match_id": str(pair["match_id"]),
+            "match_timestamp": pair["match_timestamp"].isoformat(),
+            "same_team": pair["same_team"],
+            "map": pair["match__map"],
+            "match_type": pair["match__match_type"],
+        }
+        for pair in pairs.values(
+            "match_id", "match_timestamp", "same_team", "match__map", "match__match_type"
+        )[: max(limit, 0)]
+    ]
+    return {
+        "player_id": str(player_id),
+        "other_player_id": str(other_player_id),
+        **counts,
+        "matches": matches,
+    }
+
+
+@staff_member_required
+def query_cache_stats(request):
+    return JsonResponse(cache_stats())